@@ -9,9 +9,6 @@ __metaclass__ = type
 from ansible.module_utils.urls import url_argument_spec
 from ansible.module_utils._text import to_native
 
-import json
-# import pdb
-
 # Seed the result
 result = dict(
     failed=False,
@@ -28,6 +25,8 @@ idg_endpoint_spec.update(
     server_port=dict(type='int', default=5554),  # Remote IDG port be used.
     url_username=dict(required=False, aliases=['user']),
     url_password=dict(required=False, aliases=['password'], no_log=True),
+    cache_ttl=dict(type='int', default=30),  # Seconds the list of domains is kept in cache
+    hedge_requests=dict(type='bool', default=False),  # Repeat slow reads of the domain list
 )
 
 
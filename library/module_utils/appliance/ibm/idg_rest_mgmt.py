@@ -7,14 +7,45 @@ from __future__ import absolute_import, division, print_function
 __metaclass__ = type
 
 from ansible.module_utils.six.moves.urllib.error import HTTPError
-from ansible.module_utils._text import to_native
+from ansible.module_utils._text import to_native, to_bytes
 from ansible.module_utils.urls import open_url, ConnectionError, SSLValidationError
 from ansible.module_utils.six import string_types, iteritems, iterkeys
+from ansible.module_utils.six.moves import queue
+from ansible.module_utils.appliance.ibm.idg_common import IDGException
 
 import json
-from time import sleep
+import os
+import hashlib
+import tempfile
+import threading
+from random import uniform
+from time import sleep, time
 # import pdb
 
+try:
+    import requests
+    import urllib3
+    from requests.adapters import HTTPAdapter
+    from urllib3.exceptions import InsecureRequestWarning
+    HAS_REQUESTS = True
+except ImportError:
+    HAS_REQUESTS = False
+
+# Faster decoding of the answers if orjson or ujson are available
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    HAS_FUTURES = True
+except ImportError:
+    HAS_FUTURES = False
+
 #############################
 # Class
 #############################
@@ -97,9 +128,28 @@ class IDGApi(object):
     """ Class for managing communication with
         the IBM DataPower Gateway """
 
-    SHORT_DELAY = 3
-    MEDIUM_DELAY = 5
-    LONG_DELAY = 8
+    # Polling of asynchronous actions. The delay grows exponentially up to the maximum
+    POLL_FIRST_DELAY = 0.05
+    POLL_MAX_DELAY = 2.0
+    POLL_BACKOFF = 1.6
+    POLL_TIMEOUT = 90
+
+    # User-Agent when none is given, the default of open_url
+    HTTP_AGENT = 'ansible-httpget'
+
+    # Concurrent calls to the appliance
+    MAX_WORKERS = 8
+
+    # Seconds without answer before a hedged read is sent again, and the answers that win
+    HEDGE_DELAY = 0.25
+    HEDGE_WIN_CODES = (200, 304)
+
+    # Seconds that the list of domains is kept in cache, unless cache_ttl is given
+    DOMAIN_LIST_TTL = 30
+    DOMAIN_LIST_CACHE_DIR = "~/.ansible/tmp"
+
+    # Collections that the REST api returns as a single object when they have only one element
+    COLLECTION_KEYS = ('domain', 'DomainStatus')
 
     # REST api management
     # Domains
@@ -135,6 +185,11 @@ class IDGApi(object):
         self.url_password = kwargs['password']
         self.use_proxy = kwargs['use_proxy']
         self.validate_certs = kwargs['validate_certs']
+        self.cache_ttl = kwargs.get('cache_ttl', self.DOMAIN_LIST_TTL)
+        self.hedge_requests = kwargs.get('hedge_requests', False)
+        # HTTP session, created on the first call
+        self._session = None
+        self._session_lock = threading.Lock()
 
     @staticmethod
     def apifilestore_uri2path(uri):
@@ -142,25 +197,6 @@ class IDGApi(object):
         elist = [e for e in uri.split('/') if e.strip() != ''][3:]
         return ('/'.join([elist[0]+':'] + elist[1:]))
 
-    @staticmethod
-    def get_operation_status(operations, location):
-        # If have only one operation
-        if isinstance(operations, dict):
-            if operations['location'] == location:
-                return operations['status']
-            else:
-                return None
-        elif isinstance(operations, list):
-            # multiple operations
-            op = [o for o in operations if o.get('location') == location]
-            if op:
-                return op[0]['status']
-            else:
-                return None
-        else:
-            # Unknown structure
-            return None
-
     @staticmethod
     def status_text(arg):
         # If exist the status field brings the status
@@ -171,19 +207,199 @@ class IDGApi(object):
         else:
             return None
 
-    def api_call(self, uri, **kwargs):
+    def domain_list_cache(self):
+        # Cache file of the domain list, one for each appliance and user
+        key = hashlib.sha1(to_bytes('{0}@{1}'.format(self.url_username, self.idg_host))).hexdigest()
+        return os.path.join(os.path.expanduser(self.DOMAIN_LIST_CACHE_DIR), 'idg_domains_' + key + '.json')
+
+    def read_domain_list_cache(self):
+        # Cached domain names, their ETag and if they are still fresh. None if there is no cache
+        path = self.domain_list_cache()
         try:
+            fresh = time() - os.path.getmtime(path) < self.cache_ttl
+            with open(path) as f:
+                cache = json.load(f)
+            return frozenset(cache['domains']), cache.get('etag'), fresh
+        except (IOError, OSError, ValueError, KeyError):
+            return None
 
-            url = self.idg_host + uri
-            data = None
+    def write_domain_list_cache(self, domains, etag):
+        # The cache is only an optimization, it is silently skipped on failure
+        path = self.domain_list_cache()
+        try:
+            cache_dir = os.path.dirname(path)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'domains': list(domains), 'etag': etag}, f)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            pass
+
+    def invalidate_domain_list_cache(self):
+        try:
+            os.remove(self.domain_list_cache())
+        except OSError:
+            pass
+
+    def get_domain_list(self, **kwargs):
+        # Set with the names of the configured domains.
+        # A cached list is only trusted if it has the expected domains, otherwise it is read from the appliance
+        expected = kwargs.get('expected') or []
+        if isinstance(expected, string_types):
+            expected = [expected]
+
+        cache = self.read_domain_list_cache()
+        cached_domains, etag, fresh = cache if cache is not None else (None, None, False)
+
+        if fresh and expected and cached_domains.issuperset(expected):
+            return 200, 'OK', cached_domains
+
+        # Revalidate the cached list, the body only travels if the list changed
+        code, msg, resp_headers, body = self.hedged_call(lambda: self.api_call_raw(self.URI_DOMAIN_LIST, method='GET',
+                                                                                   headers={"If-None-Match": etag} if etag else None))
+
+        if code == 304:
+            # Not modified
+            self.write_domain_list_cache(cached_domains, etag)
+            return 200, 'OK', cached_domains
+
+        data = self.parse_body(body)
+
+        if code == 200 and msg == 'OK':
+            domains = frozenset(d['name'] for d in data['domain'])
+            self.write_domain_list_cache(domains, resp_headers.get('ETag'))
+            return code, msg, domains
+        else:
+            return code, msg, data
+
+    def run_concurrently(self, func, items):
+        # Apply func to every item, at most MAX_WORKERS at the same time.
+        # The results keep the order of the items.
+        # func runs in worker threads, errors must be raised and never reported with fail_json
+        items = list(items)
+        if not HAS_FUTURES or len(items) < 2:
+            return [func(i) for i in items]
+
+        with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def hedged_call(self, func):
+        # Call func and, if it has not answered after HEDGE_DELAY seconds, call it a second time.
+        # The first answer with a code in HEDGE_WIN_CODES wins. Only for idempotent reads.
+        # The calls run on daemon threads over the shared session, so they reuse its warm connections,
+        # and a slower call that can't be cancelled never delays the end of the module
+        if not self.hedge_requests:
+            return func()
+
+        answers = queue.Queue()
+
+        def call():
             try:
-                data = kwargs['data']
-            except:
-                pass
+                answers.put((True, func()))
+            except Exception as e:
+                answers.put((False, e))
 
+        def start():
+            t = threading.Thread(target=call)
+            t.daemon = True
+            t.start()
+
+        start()
+        calls = 1
+        try:
+            ok, answer = answers.get(timeout=self.HEDGE_DELAY)
+        except queue.Empty:
+            start()
+            calls = 2
+            ok, answer = answers.get()
+
+        if calls == 2 and not (ok and answer[0] in self.HEDGE_WIN_CODES):
+            # The other call can still succeed. Any answer is better than an error
+            other_ok, other_answer = answers.get()
+            if (other_ok and other_answer[0] in self.HEDGE_WIN_CODES) or not ok:
+                ok, answer = other_ok, other_answer
+
+        if not ok:
+            raise answer
+        return answer
+
+    def session(self):
+        # Session shared by all calls and threads, the connections are kept alive between them.
+        # It is only configured here, the pool of connections of the adapter is thread safe
+        with self._session_lock:
+            if self._session is None:
+                self._session = self.new_session()
+        return self._session
+
+    def new_session(self):
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=self.MAX_WORKERS))
+        if self.url_username:
+            # Basic authentication sent with every request
+            session.auth = (self.url_username, self.url_password or '')
+        session.verify = self.validate_certs
+        if not self.validate_certs:
+            # open_url doesn't warn about unverified requests either
+            urllib3.disable_warnings(InsecureRequestWarning)
+        session.trust_env = self.use_proxy
+        session.headers.update(self.headers)
+        session.headers.update({"Connection": "keep-alive"})
+        # Same agent as open_url
+        session.headers.update({"User-Agent": self.http_agent or self.HTTP_AGENT})
+        return session
+
+    @classmethod
+    def parse_body(cls, body):
+        # Some answers (304 Not Modified, 204 No Content) don't have body.
+        # The known collections are always returned as lists
+        data = json_loads(body) if body else {}
+        for key in cls.COLLECTION_KEYS:
+            if isinstance(data.get(key), dict):
+                data[key] = [data[key]]
+        return data
+
+    def api_call(self, uri, **kwargs):
+        code, msg, resp_headers, body = self.api_call_raw(uri, **kwargs)
+        return code, msg, self.parse_body(body)
+
+    def api_call_raw(self, uri, **kwargs):
+        # Answer code, message, headers and the body without parsing
+
+        url = self.idg_host + uri
+        data = kwargs.get('data')
+        headers = kwargs.get('headers') or {}
+
+        if kwargs['method'] != 'GET' and uri.startswith(self.URI_DOMAIN_CONFIG.format('')):
+            # Domains are created, modified or removed
+            self.invalidate_domain_list_cache()
+
+        if HAS_REQUESTS and (self.force_basic_auth or not self.url_username):
+            return self.session_call(url, kwargs['method'], data, headers)
+        else:
+            return self.open_url_call(url, kwargs['method'], data, headers)
+
+    def session_call(self, url, method, data, headers):
+        # The session always sends the credentials.
+        # Without force_basic_auth open_url is used, it only sends them when the appliance asks for them
+        try:
+            resp = self.session().request(method, url, data=data, headers=headers, timeout=self.timeout)
+
+        except requests.exceptions.SSLError as e:
+            raise IDGException(to_native("Error validating the server's certificate for ({0}). {1}".format(url, str(e))))
+        except requests.exceptions.ConnectionError as e:
+            raise IDGException(to_native("Error connecting to ({0}). {1}".format(url, str(e))))
+        except Exception as e:
+            raise IDGException(to_native("Unknown error for ({0}). {1}".format(url, str(e))))
+        else:
+            return int(resp.status_code), resp.reason, resp.headers, resp.content
+
+    def open_url_call(self, url, method, data, headers):
+        try:
             resp = open_url(url,
-                            method=kwargs['method'],
-                            headers=self.headers,
+                            method=method,
+                            headers=dict(self.headers, **headers),
                             timeout=self.timeout,
                             url_username=self.url_username,
                             url_password=self.url_password,
@@ -195,38 +411,42 @@ class IDGApi(object):
 
         except HTTPError as e:
             # Get results with code different from 200
-            return int(e.getcode()), e.msg, json.loads(e.read())
+            return int(e.getcode()), e.msg, e.info(), e.read()
         except SSLValidationError as e:
-            self.ansible_module.fail_json(msg=to_native("Error validating the server's certificate for ({0}). {1}".format(url, str(e))))
+            raise IDGException(to_native("Error validating the server's certificate for ({0}). {1}".format(url, str(e))))
         except ConnectionError as e:
-            self.ansible_module.fail_json(msg=to_native("Error connecting to ({0}). {1}".format(url, str(e))))
+            raise IDGException(to_native("Error connecting to ({0}). {1}".format(url, str(e))))
         except Exception as e:
-            self.ansible_module.fail_json(msg=to_native("Unknown error for ({0}). {1}".format(url, str(e))))
+            raise IDGException(to_native("Unknown error for ({0}). {1}".format(url, str(e))))
         else:
-            return int(resp.getcode()), resp.msg, json.loads(resp.read())
+            return int(resp.getcode()), resp.msg, resp.info(), resp.read()
 
     def wait_for_action_end(self, uri, **kwargs):
+        # Polls the action until it ends.
+        # Returns the code, message and data of the last reading, which carry the result of the action
 
-        str_results = ['processed', 'completed']
-        max_steps = 30
+        str_results = ['processed', 'completed', 'error']
+        deadline = time() + self.POLL_TIMEOUT
         count = 0
-        action_result = ''
         resource = uri.rsplit('/', 1)[-1]
         # pdb.set_trace()
 
-        while (action_result.lower() not in str_results) and (count < max_steps):
+        while True:
             # Wait to complete
-            code, msg, data = self.api_call(uri + '/pending', method='GET', data=None)
-            count += 1
+            code, msg, data = self.api_call(kwargs['href'], method='GET')
             if code == 200 and msg == 'OK':
-                action_result = self.get_operation_status(data['operations'], kwargs['href'])
-                if action_result.lower() not in str_results:
-                    sleep(self.SHORT_DELAY)
+                status = data.get('status')
+                if status is None:
+                    # The action does not report its status
+                    raise IDGException(to_native(self.ERROR_RETRIEVING_STATUS.format(kwargs['state'], resource)))
+                if status.lower() in str_results:
+                    return code, msg, data
+                if time() >= deadline:
+                    raise IDGException(to_native((self.ERROR_RETRIEVING_STATUS + 'Reached the maximum level of interactions').format(kwargs['state'],
+                                                                                                                                     resource)))
+                # Fast actions are detected early, slow ones are not polled too often
+                sleep(min(self.POLL_MAX_DELAY, self.POLL_FIRST_DELAY * self.POLL_BACKOFF ** count) + uniform(0, self.POLL_FIRST_DELAY))
+                count += 1
             else:
                 # Opps can't get status
-                self.ansible_module.fail_json(msg=to_native(self.ERROR_RETRIEVING_STATUS.format(kwargs['state'], resource)))
-
-        if count == max_steps:
-            self.ansible_module.fail_json(msg=to_native((self.ERROR_RETRIEVING_STATUS + 'Reached the maximum level of interactions').format(kwargs['state'], resource)))
-        else:
-            return action_result.capitalize()
+                raise IDGException(to_native(self.ERROR_RETRIEVING_STATUS.format(kwargs['state'], resource)))
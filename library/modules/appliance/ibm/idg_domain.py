@@ -240,7 +240,6 @@ msg:
 '''
 
 import json
-import yaml
 # import pdb
 
 from ansible.module_utils.basic import AnsibleModule
@@ -248,20 +247,24 @@ from ansible.module_utils._text import to_native
 
 # Common package of our implementation for IDG
 try:
-    from ansible.module_utils.appliance.ibm.idg_common import result, idg_endpoint_spec, IDGUtils
+    from ansible.module_utils.appliance.ibm.idg_common import result, idg_endpoint_spec, IDGUtils, IDGException
     from ansible.module_utils.appliance.ibm.idg_rest_mgmt import IDGApi, ErrorHandler
     HAS_IDG_DEPS = True
 except ImportError:
     HAS_IDG_DEPS = False
 
 # Version control
-__MODULE_NAME = yaml.load(DOCUMENTATION)['module']
+__MODULE_NAME = 'idg_domain'
 __MODULE_VERSION = "1.0"
 __MODULE_FULLNAME = __MODULE_NAME + '-' + __MODULE_VERSION
 
 
 def main():
 
+    # Validates the dependence of the utility module
+    if not HAS_IDG_DEPS:
+        AnsibleModule(argument_spec={}).fail_json(msg="The IDG utils modules is required")
+
     try:
         # Define the available arguments/parameters that a user can pass to the module
         # File permission to the local: directory
@@ -315,10 +318,6 @@ def main():
             required_if=[['state', 'quiesced', ['quiesce_conf']]]
         )
 
-        # Validates the dependence of the utility module
-        if not HAS_IDG_DEPS:
-            module.fail_json(msg="The IDG utils modules is required")
-
         # Parse arguments to dict
         idg_data_spec = IDGUtils.parse_to_dict(module, module.params['idg_connection'], 'IDGConnection', IDGUtils.ANSIBLE_VERSION)
         filemap_data_spec = IDGUtils.parse_to_dict(module, module.params['file_map'], 'FileMap', IDGUtils.ANSIBLE_VERSION)
@@ -349,11 +348,10 @@ def main():
                           validate_certs=idg_data_spec['validate_certs'],
                           user=idg_data_spec['user'],
                           password=idg_data_spec['password'],
+                          cache_ttl=idg_data_spec['cache_ttl'],
+                          hedge_requests=idg_data_spec['hedge_requests'],
                           force_basic_auth=IDGUtils.BASIC_AUTH_SPEC)
 
-        # Variable to store the status of the action
-        action_result = ''
-
         # Configuration template for the domain
         domain_obj_msg = {"Domain": {
             "name": domain_name,
@@ -403,17 +401,12 @@ def main():
         # Intermediate values ​​for result
         tmp_result={"msg": None, "name": domain_name, "changed": None}
 
-        # List of configured domains
-        chk_code, chk_msg, chk_data = idg_mgmt.api_call(IDGApi.URI_DOMAIN_LIST, method='GET')
+        # List of configured domains.
+        # Domains are created and removed here, so the cached list is always revalidated with the appliance
+        chk_code, chk_msg, configured_domains = idg_mgmt.get_domain_list()
 
         if chk_code == 200 and chk_msg == 'OK':  # If the answer is correct
 
-            # List of existing domains
-            if isinstance(chk_data['domain'], dict):  # if has only default domain
-                configured_domains = [chk_data['domain']['name']]
-            else:
-                configured_domains = [d['name'] for d in chk_data['domain']]
-
             if state in ('present', 'restarted', 'quiesced', 'unquiesced'):  # They need for or do a domain
 
                 if domain_name not in configured_domains:  # Domain NOT EXIST.
@@ -491,16 +484,17 @@ def main():
                                                                                         data=json.dumps(restart_act_msg))
 
                             if restart_code == 202 and restart_msg == 'Accepted':
-                                # Asynchronous actions restart accepted. Wait for complete
-                                action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name),
-                                                                             href=restart_data['_links']['location']['href'], state=state)
-
-                                # Restart completed. Get result
-                                acs_code, acs_msg, acs_data = idg_mgmt.api_call(restart_data['_links']['location']['href'], method='GET')
+                                # Asynchronous actions restart accepted. Wait for complete and get the result
+                                acs_code, acs_msg, acs_data = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name),
+                                                                                           href=restart_data['_links']['location']['href'], state=state)
 
                                 if acs_code == 200 and acs_msg == 'OK':
+                                    if acs_data['status'] == 'error':
+                                        # The action ended with errors
+                                        module.fail_json(msg=IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(acs_data['error'])))
+
                                     # Restarted successfully
-                                    tmp_result['msg'] = action_result
+                                    tmp_result['msg'] = acs_data['status'].capitalize()
                                     tmp_result['changed'] = True
                                 else:
                                     # Can't retrieve the restart result
@@ -522,10 +516,7 @@ def main():
                             # pdb.set_trace()
                             if qds_code == 200 and qds_msg == 'OK':
 
-                                if isinstance(qds_data['DomainStatus'], dict):
-                                    domain_quiesce_status = qds_data['DomainStatus']['QuiesceState']
-                                else:
-                                    domain_quiesce_status = [d['QuiesceState'] for d in qds_data['DomainStatus'] if d['Domain'] == domain_name][0]
+                                domain_quiesce_status = [d['QuiesceState'] for d in qds_data['DomainStatus'] if d['Domain'] == domain_name][0]
 
                                 if state == 'quiesced':
                                     if domain_quiesce_status == '':
@@ -539,16 +530,17 @@ def main():
 
                                         # pdb.set_trace()
                                         if qd_code == 202 and qd_msg == 'Accepted':
-                                            # Asynchronous actions quiesce accepted. Wait for complete
-                                            action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name),
-                                                                                         href=qd_data['_links']['location']['href'], state=state)
-
-                                            # Quiesced completed. Get result
-                                            acs_code, acs_msg, acs_data = idg_mgmt.api_call(qd_data['_links']['location']['href'], method='GET')
+                                            # Asynchronous actions quiesce accepted. Wait for complete and get the result
+                                            acs_code, acs_msg, acs_data = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name),
+                                                                                                       href=qd_data['_links']['location']['href'], state=state)
 
                                             if acs_code == 200 and acs_msg == 'OK':
+                                                if acs_data['status'] == 'error':
+                                                    # The action ended with errors
+                                                    module.fail_json(msg=IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(acs_data['error'])))
+
                                                 # Quiesced successfully
-                                                tmp_result['msg'] = action_result
+                                                tmp_result['msg'] = acs_data['status'].capitalize()
                                                 tmp_result['changed'] = True
                                             else:
                                                 # Can't get the quiesced action result
@@ -578,16 +570,17 @@ def main():
 
                                         # pdb.set_trace()
                                         if uqd_code == 202 and uqd_msg == 'Accepted':
-                                            # Asynchronous actions unquiesce accepted. Wait for complete
-                                            action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name),
-                                                                                         href=uqd_data['_links']['location']['href'], state=state)
-
-                                            # Unquiesced completed. Get result
-                                            acs_code, acs_msg, acs_data = idg_mgmt.api_call(uqd_data['_links']['location']['href'], method='GET')
+                                            # Asynchronous actions unquiesce accepted. Wait for complete and get the result
+                                            acs_code, acs_msg, acs_data = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name),
+                                                                                                       href=uqd_data['_links']['location']['href'], state=state)
 
                                             if acs_code == 200 and acs_msg == 'OK':
+                                                if acs_data['status'] == 'error':
+                                                    # The action ended with errors
+                                                    module.fail_json(msg=IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(acs_data['error'])))
+
                                                 # Unquiesce successfully
-                                                tmp_result['msg'] = action_result
+                                                tmp_result['msg'] = acs_data['status'].capitalize()
                                                 tmp_result['changed'] = True
                                             else:
                                                 # Can't get unquiesce final result
@@ -643,18 +636,15 @@ def main():
         # Finish
         #
         # Update
-        for k, v in tmp_result.items():
-            if v != None:
-                result[k] = v
+        result.update({k: v for k, v in tmp_result.items() if v is not None})
 
-    except (NameError, UnboundLocalError) as e:
-        # Very early error
-        module_except = AnsibleModule(argument_spec={})
-        module_except.fail_json(msg=to_native(e))
+    except IDGException as e:
+        # Controlled error while working with the appliance
+        module.fail_json(msg=to_native(e))
 
     except Exception as e:
         # Uncontrolled exception
-        module.fail_json(msg=(IDGUtils.UNCONTROLLED_EXCEPTION + '. {0}').format(to_native(e)))
+        module.fail_json(msg='{0}. {1}'.format(IDGUtils.UNCONTROLLED_EXCEPTION, to_native(e)))
     else:
         # That's all folks!
         module.exit_json(**result)
@@ -27,7 +27,8 @@ options:
 
   domain:
     description:
-      - Domain identifier.
+      - Domain identifier, or a list of them.
+      - When several domains are given, the checkpoint of each one is managed concurrently.
     required: True
 
   state:
@@ -72,6 +73,15 @@ EXAMPLES = '''
         idg_connection: "{{ remote_idg }}"
         state: present
 
+  - name: Create the same checkpoint in several domains
+    idg_domain_chkpoint:
+        name: "{{ chkpoint_name }}"
+        domain:
+          - test1
+          - test2
+        idg_connection: "{{ remote_idg }}"
+        state: present
+
   # Uncontrollable modifications
 
   - name: Restore from checkpoint
@@ -86,7 +96,7 @@ EXAMPLES = '''
 RETURN = '''
 domain:
   description:
-    - The name of the domain.
+    - The name of the domain, or the list of them.
   returned: changed and success
   type: string
   sample:
@@ -109,37 +119,122 @@ msg:
   sample:
     - Configuration was created.
     - Unknown error for (https://idg-host1:5554/mgmt/domains/config/). <open_url error timed out>
+
+results:
+  description:
+    - The result (name, domain, msg, changed, failed) of the checkpoint in each domain.
+  returned: when several domains are given
+  type: list
 '''
 
 import json
-import yaml
-# import pdb
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils._text import to_native
 
 # Common package of our implementation for IDG
 try:
-    from ansible.module_utils.appliance.ibm.idg_common import result, idg_endpoint_spec, IDGUtils
+    from ansible.module_utils.appliance.ibm.idg_common import result, idg_endpoint_spec, IDGUtils, IDGException
     from ansible.module_utils.appliance.ibm.idg_rest_mgmt import IDGApi, ErrorHandler
     HAS_IDG_DEPS = True
 except ImportError:
     HAS_IDG_DEPS = False
 
 # Version control
-__MODULE_NAME = yaml.load(DOCUMENTATION)['module']
+__MODULE_NAME = 'idg_domain_chkpoint'
 __MODULE_VERSION = "1.0"
 __MODULE_FULLNAME = __MODULE_NAME + '-' + __MODULE_VERSION
 
+# Action message, the only variable parts are the action and the checkpoint name
+ACTION_MSG = '{{"{0}": {{"ChkName": {1}}}}}'
+
+# Action for every state and the error returned when the checkpoint is already in that state
+ACTIONS = {
+    'present': ('SaveCheckpoint', "Configuration Checkpoint '{0}' already exists."),  # Save checkpoint
+    'absent': ('RemoveCheckpoint', "Cannot find Configuration Checkpoint '{0}'."),  # Remove checkpoint
+    'restored': ('RollbackCheckpoint', None)  # Rollback checkpoint
+}
+
+
+def chkpoint_action(idg_mgmt, state, domain_name, chkpoint_name, action):
+    # Brings the checkpoint of one domain to the desired state
+    # action: (name, message, error when the checkpoint is already in the state)
+
+    act_name, act_body, immutable_error = action
+
+    # Error reported by the appliance
+    act_error = None
+
+    # Result for the domain
+    chk_result = {"name": chkpoint_name, "domain": domain_name, "msg": None, "changed": None, "failed": False}
+
+    act_code, act_msg, act_data = idg_mgmt.api_call(IDGApi.URI_ACTION.format(domain_name), method='POST', data=act_body)
+
+    if act_code == 202 and act_msg == 'Accepted':
+        # Asynchronous action accepted. Wait for complete and get the result
+        res_code, res_msg, res_data = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name),
+                                                                   href=act_data['_links']['location']['href'], state=state)
+
+        if res_code == 200 and res_msg == 'OK':
+
+            if res_data['status'] == 'error':
+                act_error = res_data['error']
+            else:
+                chk_result['msg'] = res_data['status'].capitalize()
+                chk_result['changed'] = True
+        else:
+            # Can't retrieve the action result
+            raise IDGException(IDGApi.ERROR_RETRIEVING_RESULT.format(state, domain_name))
+
+    elif act_code == 200 and act_msg == 'OK':
+        # Successfully processed synchronized action
+        chk_result['msg'] = idg_mgmt.status_text(act_data[act_name])
+        chk_result['changed'] = True
+
+    elif act_code == 400 and act_msg == 'Bad Request':
+        # Wrong request, maybe the checkpoint is already in the desired state
+        act_error = act_data['error']
+
+    else:
+        # Action not accepted
+        raise IDGException(IDGApi.ERROR_ACCEPTING_ACTION.format(state, domain_name))
+
+    if act_error is not None:
+        chk_result['changed'] = False
+        if immutable_error is not None and immutable_error in act_error:
+            chk_result['msg'] = IDGUtils.IMMUTABLE_MESSAGE
+        else:
+            chk_result['msg'] = IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(act_error))
+            chk_result['failed'] = True
+
+    return chk_result
+
+
+def chkpoint_outcome(idg_mgmt, state, domain_name, chkpoint_name, action):
+    # Runs in a worker thread. The errors of a domain are kept in its result,
+    # so they don't discard what was done in the other domains
+    try:
+        return chkpoint_action(idg_mgmt, state, domain_name, chkpoint_name, action)
+    except IDGException as e:
+        msg = to_native(e)
+    except Exception as e:
+        msg = '{0}. {1}'.format(IDGUtils.UNCONTROLLED_EXCEPTION, to_native(e))
+
+    return {"name": chkpoint_name, "domain": domain_name, "msg": msg, "changed": False, "failed": True}
+
 
 def main():
 
+    # Validates the dependence of the utility module
+    if not HAS_IDG_DEPS:
+        AnsibleModule(argument_spec={}).fail_json(msg="The IDG utils modules is required")
+
     try:
         # Arguments/parameters that a user can pass to the module
         module_args = dict(
             state=dict(type='str', choices=['present', 'absent', 'restored'], default='present'),  # Checkpoint state
             idg_connection=dict(type='dict', options=idg_endpoint_spec, required=True),  # IDG connection
-            domain=dict(type='str', required=True),  # Domain
+            domain=dict(type='list', required=True),  # Domain or domains
             name=dict(type='str', required=True)  # Checkpoint
         )
 
@@ -149,18 +244,17 @@ def main():
             supports_check_mode=True
         )
 
-        # Validates the dependence of the utility module
-        if not HAS_IDG_DEPS:
-            module.fail_json(msg="The IDG utils modules is required")
-
         # Parse arguments to dict
         idg_data_spec = IDGUtils.parse_to_dict(module, module.params['idg_connection'], 'IDGConnection', IDGUtils.ANSIBLE_VERSION)
 
-        # Status & domain
+        # Status & domains
         state = module.params['state']
-        domain_name = module.params['domain']
+        domain_names = module.params['domain']
         chkpoint_name = module.params['name']
 
+        if not domain_names:
+            module.fail_json(msg='At least one domain is required.')
+
         # Init IDG API connect
         idg_mgmt = IDGApi(ansible_module=module,
                           idg_host="https://{0}:{1}".format(idg_data_spec['server'], idg_data_spec['server_port']),
@@ -171,175 +265,53 @@ def main():
                           validate_certs=idg_data_spec['validate_certs'],
                           user=idg_data_spec['user'],
                           password=idg_data_spec['password'],
+                          cache_ttl=idg_data_spec['cache_ttl'],
+                          hedge_requests=idg_data_spec['hedge_requests'],
                           force_basic_auth=IDGUtils.BASIC_AUTH_SPEC)
 
-        # Action messages:
-        # Save checkpoint
-        save_act_msg = {"SaveCheckpoint": {"ChkName": chkpoint_name}}
-
-        # Rollback checkpoint
-        rollback_act_msg = {"RollbackCheckpoint": {"ChkName": chkpoint_name}}
-
-        # Remove checkpoint
-        remove_act_msg = {"RemoveCheckpoint": {"ChkName": chkpoint_name}}
-
         #
         # Here the action begins
         #
 
-        # Variable to store the status of the action
-        action_result = ''
-
         # Intermediate values ​​for result
-        tmp_result={"name": chkpoint_name, "domain": domain_name, "msg": None, "changed": None, "failed": None}
+        tmp_result={"name": chkpoint_name, "domain": domain_names, "msg": None, "changed": None, "failed": None}
 
         # List of configured domains
-        chk_code, chk_msg, chk_data = idg_mgmt.api_call(IDGApi.URI_DOMAIN_LIST, method='GET')
+        chk_code, chk_msg, configured_domains = idg_mgmt.get_domain_list(expected=domain_names)
 
         if chk_code == 200 and chk_msg == 'OK':  # If the answer is correct
 
-            if isinstance(chk_data['domain'], dict):  # if has only default domain
-                configured_domains = [chk_data['domain']['name']]
-            else:
-                configured_domains = [d['name'] for d in chk_data['domain']]
-
-            if domain_name in configured_domains:  # Domain EXIST.
-
-                # pdb.set_trace()
-                if state == 'present':
-
-                    # If the user is working in only check mode we do not want to make any changes
-                    IDGUtils.implement_check_mode(module, result)
-
-                    # pdb.set_trace()
-                    create_code, create_msg, create_data = idg_mgmt.api_call(IDGApi.URI_ACTION.format(domain_name), method='POST',
-                                                                             data=json.dumps(save_act_msg))
-
-                    if create_code == 202 and create_msg == 'Accepted':
-                        # Asynchronous actions save accepted. Wait for complete
-                        action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name), href=create_data['_links']['location']['href'],
-                                                                     state=state)
-
-                        # Create checkpoint completed. Get result
-                        dcr_code, dcr_msg, dcr_data = idg_mgmt.api_call(create_data['_links']['location']['href'], method='GET')
-
-                        if dcr_code == 200 and dcr_msg == 'OK':
-
-                            if dcr_data['status'] == 'error':
-                                # pdb.set_trace()
-                                tmp_result['changed'] = False
-                                if ("Configuration Checkpoint '" + chkpoint_name + "' already exists.") in dcr_data['error']:
-                                    tmp_result['msg'] = IDGUtils.IMMUTABLE_MESSAGE
-                                else:
-                                    tmp_result['msg'] = IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(dcr_data['error']))
-                                    tmp_result['failed'] = True
-                            else:
-                                tmp_result['msg'] = dcr_data['status'].capitalize()
-                                tmp_result['changed'] = True
-                        else:
-                            # Can't retrieve the create checkpoint result
-                            module.fail_json(msg=IDGApi.ERROR_RETRIEVING_RESULT.format(state, domain_name))
-
-                    elif create_code == 200 and create_msg == 'OK':
-                        # Successfully processed synchronized action
-                        tmp_result['msg'] = idg_mgmt.status_text(create_data['SaveCheckpoint'])
-                        tmp_result['changed'] = True
-
-                    else:
-                        # Create checkpoint not accepted
-                        module.fail_json(msg=IDGApi.ERROR_ACCEPTING_ACTION.format(state, domain_name))
-
-                elif state == 'absent':
-
-                    # If the user is working in only check mode we do not want to make any changes
-                    IDGUtils.implement_check_mode(module, result)
-
-                    # pdb.set_trace()
-                    rm_code, rm_msg, rm_data = idg_mgmt.api_call(IDGApi.URI_ACTION.format(domain_name), method='POST',
-                                                                 data=json.dumps(remove_act_msg))
-
-                    if rm_code == 202 and rm_msg == 'Accepted':
-                        # Asynchronous actions remove accepted. Wait for complete
-                        action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name), href=rm_data['_links']['location']['href'],
-                                                                     state=state)
-
-                        # Remove checkpoint completed. Get result
-                        drm_code, drm_msg, drm_data = idg_mgmt.api_call(rm_data['_links']['location']['href'], method='GET')
-
-                        if drm_code == 200 and drm_msg == 'OK':
-
-                            if drm_data['status'] == 'error':
-                                # pdb.set_trace()
-                                tmp_result['msg'] = IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(drm_data['error']))
-                                tmp_result['changed'] = False
-                                tmp_result['failed'] = True
-                            else:
-                                tmp_result['msg'] = drm_data['status'].capitalize()
-                                tmp_result['changed'] = True
-                        else:
-                            # Can't retrieve the create checkpoint result
-                            module.fail_json(msg=IDGApi.ERROR_RETRIEVING_RESULT.format(state, domain_name))
-
-                    elif rm_code == 200 and rm_msg == 'OK':
-                        # Successfully processed synchronized action
-                        tmp_result['msg'] = idg_mgmt.status_text(rm_data['RemoveCheckpoint'])
-                        tmp_result['changed'] = True
-
-                    elif rm_code == 400 and rm_msg == 'Bad Request':
-                        # Wrong request, maybe there simply is no checkpoint
-                        if ("Cannot find Configuration Checkpoint '" + chkpoint_name + "'.") in rm_data['error']:
-                            tmp_result['msg'] = IDGUtils.IMMUTABLE_MESSAGE
-                        else:
-                            tmp_result['msg'] = IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(rm_data['error']))
-                            tmp_result['failed'] = True
-
-                    else:
-                        # Create checkpoint not accepted
-                        module.fail_json(msg=IDGApi.ERROR_ACCEPTING_ACTION.format(state, domain_name))
-
-                elif state == 'restored':
-
-                    # If the user is working in only check mode we do not want to make any changes
-                    IDGUtils.implement_check_mode(module, result)
-
-                    # pdb.set_trace()
-                    bak_code, bak_msg, bak_data = idg_mgmt.api_call(IDGApi.URI_ACTION.format(domain_name), method='POST',
-                                                                    data=json.dumps(rollback_act_msg))
-
-                    if bak_code == 202 and bak_msg == 'Accepted':
-                        # Asynchronous actions remove accepted. Wait for complete
-                        action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name), href=bak_data['_links']['location']['href'],
-                                                                     state=state)
+            missing_domains = [d for d in domain_names if d not in configured_domains]
 
-                        # Remove checkpoint completed. Get result
-                        dbak_code, dbak_msg, dbak_data = idg_mgmt.api_call(bak_data['_links']['location']['href'], method='GET')
+            if not missing_domains:  # Domains EXIST.
 
-                        if dbak_code == 200 and dbak_msg == 'OK':
+                # If the user is working in only check mode we do not want to make any changes
+                IDGUtils.implement_check_mode(module, result)
 
-                            if dbak_data['status'] == 'error':
-                                # pdb.set_trace()
-                                tmp_result['msg'] = IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(dbak_data['error']))
-                                tmp_result['changed'] = False
-                                tmp_result['failed'] = True
-                            else:
-                                tmp_result['msg'] = dbak_data['status'].capitalize()
-                                tmp_result['changed'] = True
-                        else:
-                            # Can't retrieve the create checkpoint result
-                            module.fail_json(msg=IDGApi.ERROR_RETRIEVING_RESULT.format(state, domain_name))
+                # The action message and the expected errors are the same for all domains
+                act_name, immutable_error = ACTIONS[state]
+                action = (act_name,
+                          ACTION_MSG.format(act_name, json.dumps(chkpoint_name)),
+                          immutable_error.format(chkpoint_name) if immutable_error is not None else None)
 
-                    elif bak_code == 200 and bak_msg == 'OK':
-                        # Successfully processed synchronized action
-                        tmp_result['msg'] = idg_mgmt.status_text(bak_data['RollbackCheckpoint'])
-                        tmp_result['changed'] = True
+                # The checkpoints of the domains are managed concurrently
+                chk_results = idg_mgmt.run_concurrently(lambda d: chkpoint_outcome(idg_mgmt, state, d, chkpoint_name, action), domain_names)
 
+                if len(chk_results) == 1:
+                    tmp_result.update(chk_results[0])
+                else:
+                    failed_results = [r for r in chk_results if r['failed']]
+                    tmp_result['results'] = chk_results
+                    tmp_result['changed'] = any(r['changed'] for r in chk_results)
+                    if failed_results:
+                        tmp_result['msg'] = ' '.join(r['msg'] for r in failed_results)
+                        tmp_result['failed'] = True
                     else:
-                        # Create checkpoint not accepted
-                        module.fail_json(msg=IDGApi.ERROR_ACCEPTING_ACTION.format(state, domain_name))
+                        tmp_result['msg'] = IDGUtils.COMPLETED_MESSAGE
 
             else:  # Domain NOT EXIST.
                 # Can't work the configuration of non-existent domain
-                module.fail_json(msg=(IDGApi.ERROR_REACH_STATE + " " + IDGApi.ERROR_NOT_DOMAIN).format(state, domain_name))
+                module.fail_json(msg=(IDGApi.ERROR_REACH_STATE + " " + IDGApi.ERROR_NOT_DOMAIN).format(state, ', '.join(missing_domains)))
 
         else:  # Can't read domain's lists
             module.fail_json(msg=IDGApi.ERROR_GET_DOMAIN_LIST)
@@ -348,18 +320,15 @@ def main():
         # Finish
         #
         # Update
-        for k, v in tmp_result.items():
-            if v != None:
-                result[k] = v
+        result.update({k: v for k, v in tmp_result.items() if v is not None})
 
-    except (NameError, UnboundLocalError) as e:
-        # Very early error
-        module_except = AnsibleModule(argument_spec={})
-        module_except.fail_json(msg=to_native(e))
+    except IDGException as e:
+        # Controlled error while working with a domain
+        module.fail_json(msg=to_native(e))
 
     except Exception as e:
         # Uncontrolled exception
-        module.fail_json(msg=(IDGUtils.UNCONTROLLED_EXCEPTION + '. {0}').format(to_native(e)))
+        module.fail_json(msg='{0}. {1}'.format(IDGUtils.UNCONTROLLED_EXCEPTION, to_native(e)))
     else:
         # That's all folks!
         module.exit_json(**result)
@@ -97,6 +97,18 @@ options:
     default: False
     type: bool
 
+  deployment_policy:
+    description:
+      - Name of the deployment policy to apply to the imported configuration
+      - Only be taken into account I(state=imported)
+    type: str
+
+  deployment_policy_params:
+    description:
+      - Name of the deployment policy variables to use with I(deployment_policy), which is then required
+      - Only be taken into account I(state=imported)
+    type: str
+
 extends_documentation_fragment: idg
 
 author:
@@ -196,7 +208,7 @@ results:
 '''
 
 import json
-import yaml
+from collections import Counter
 # import pdb
 
 from ansible.module_utils.basic import AnsibleModule
@@ -204,31 +216,74 @@ from ansible.module_utils._text import to_native
 
 # Common package of our implementation for IDG
 try:
-    from ansible.module_utils.appliance.ibm.idg_common import result, idg_endpoint_spec, IDGUtils
-    from ansible.module_utils.appliance.ibm.idg_rest_mgmt import IDGApi
+    from ansible.module_utils.appliance.ibm.idg_common import result, idg_endpoint_spec, IDGUtils, IDGException
+    from ansible.module_utils.appliance.ibm.idg_rest_mgmt import IDGApi, ErrorHandler
     HAS_IDG_DEPS = True
 except ImportError:
     HAS_IDG_DEPS = False
 
 # Version control
-__MODULE_NAME = yaml.load(DOCUMENTATION)['module']
+__MODULE_NAME = 'idg_domain_config'
 __MODULE_VERSION = "1.0"
 __MODULE_FULLNAME = __MODULE_NAME + '-' + __MODULE_VERSION
 
+# Translate boolean parameters to: "on", "off"
+ON_OFF = {True: "on", False: "off"}
+
+# Action messages without parameters, already serialized
+# Reset
+RESET_ACT_MSG = b'{"ResetThisDomain": {}}'
+
+# Save
+SAVE_ACT_MSG = b'{"SaveConfig": {}}'
+
 
 # Return dictionary with the inventory of states
 def get_status_summary(list_dict):
-    s = {}
-    for i in list_dict:
-        if i['status'] not in s.keys():
-            s.update({i['status']: 1})
+    return dict(Counter(i['status'] for i in list_dict))
+
+
+# Sections of the import results in the order they are reported, the element that each one lists
+# (None for the whole section) and if a summary of the element statuses is added
+IMPORT_SECTIONS = (('exec-script-results', 'cfg-result', True),
+                   ('file-copy-log', 'file-result', False),
+                   ('imported-debug', None, False),
+                   ('imported-files', 'file', True),
+                   ('imported-objects', 'object', True))
+
+
+# Return the summary of a section of the import results. None if the section does not exist
+def get_import_summary(import_results, section, item, summary):
+    if section not in import_results:
+        return None
+
+    section_results = import_results[section]
+    if item is None:
+        return {section: section_results}
+    elif not summary:
+        try:
+            return {section: section_results[item]}
+        except Exception:
+            # Without the element the section is not reported
+            return None
+
+    try:
+        if isinstance(section_results[item], list):
+            return {section: {"summary": {"total": len(section_results[item]),
+                                          "status": get_status_summary(section_results[item])},
+                              "detail": section_results[item]}}
         else:
-            s[i['status']] += 1
-    return s
+            return {section: section_results[item]}
+    except Exception:
+        return {section: section_results}
 
 
 def main():
 
+    # Validates the dependence of the utility module
+    if not HAS_IDG_DEPS:
+        AnsibleModule(argument_spec={}).fail_json(msg="The IDG utils modules is required")
+
     try:
         # Arguments/parameters that a user can pass to the module
         module_args = dict(
@@ -245,9 +300,9 @@ def main():
             overwrite_files=dict(type='bool', default=False),  # Overwrite files that exist
             overwrite_objects=dict(type='bool', default=False),  # Overwrite objects that exist
             dry_run=dict(type='bool', default=False),  # Import package (on) or validate the import operation without importing (off).
-            rewrite_local_ip=dict(type='bool', default=False)  # The local address binding to their equivalent interfaces in appliance
-            # TODO !!!
-            # DeploymentPolicy
+            rewrite_local_ip=dict(type='bool', default=False),  # The local address binding to their equivalent interfaces in appliance
+            deployment_policy=dict(type='str', required=False),  # Deployment policy applied on import
+            deployment_policy_params=dict(type='str', required=False)  # Deployment policy variables
         )
 
         # AnsibleModule instantiation
@@ -255,19 +310,20 @@ def main():
             argument_spec=module_args,
             supports_check_mode=True,
             # Interaction between parameters
-            required_if=[['state', 'imported', ['input_file']]]
+            required_if=[['state', 'imported', ['input_file']]],
+            required_by={'deployment_policy_params': ['deployment_policy']}
         )
 
-        # Validates the dependence of the utility module
-        if not HAS_IDG_DEPS:
-            module.fail_json(msg="The IDG utils modules is required")
+        # Module parameters
+        params = module.params
 
         # Parse arguments to dict
-        idg_data_spec = IDGUtils.parse_to_dict(module, module.params['idg_connection'], 'IDGConnection', IDGUtils.ANSIBLE_VERSION)
+        idg_data_spec = IDGUtils.parse_to_dict(module, params['idg_connection'], 'IDGConnection', IDGUtils.ANSIBLE_VERSION)
 
         # Status & domain
-        state = module.params['state']
-        domain_name = module.params['name']
+        state = params['state']
+        domain_name = params['name']
+        action_uri = IDGApi.URI_ACTION.format(domain_name)
 
         # Init IDG API connect
         idg_mgmt = IDGApi(ansible_module=module,
@@ -279,40 +335,35 @@ def main():
                           validate_certs=idg_data_spec['validate_certs'],
                           user=idg_data_spec['user'],
                           password=idg_data_spec['password'],
+                          cache_ttl=idg_data_spec['cache_ttl'],
+                          hedge_requests=idg_data_spec['hedge_requests'],
                           force_basic_auth=IDGUtils.BASIC_AUTH_SPEC)
 
-        # Variable to store the status of the action
-        action_result = ''
-
         # Configuration template for the domain
         export_action_msg = {"Export": {
             "Format": "ZIP",
-            "UserComment": module.params['user_summary'],
-            "AllFiles": IDGUtils.str_on_off(module.params['all_files']),
-            "Persisted": IDGUtils.str_on_off(module.params['persisted']),
-            "IncludeInternalFiles": IDGUtils.str_on_off(module.params['internal_files'])
+            "UserComment": params['user_summary'],
+            "AllFiles": ON_OFF[bool(params['all_files'])],
+            "Persisted": ON_OFF[bool(params['persisted'])],
+            "IncludeInternalFiles": ON_OFF[bool(params['internal_files'])]
             # TODO
             # "DeploymentPolicy":""
         }}
 
         import_action_msg = {"Import": {
             "Format": "ZIP",
-            "InputFile": module.params['input_file'],
-            "OverwriteFiles": IDGUtils.str_on_off(module.params['overwrite_files']),
-            "OverwriteObjects": IDGUtils.str_on_off(module.params['overwrite_objects']),
-            "DryRun": IDGUtils.str_on_off(module.params['dry_run']),
-            "RewriteLocalIP": IDGUtils.str_on_off(module.params['rewrite_local_ip'])
-            # TODO
-            # "DeploymentPolicy": "name",
-            # "DeploymentPolicyParams": "name",
+            "InputFile": params['input_file'],
+            "OverwriteFiles": ON_OFF[bool(params['overwrite_files'])],
+            "OverwriteObjects": ON_OFF[bool(params['overwrite_objects'])],
+            "DryRun": ON_OFF[bool(params['dry_run'])],
+            "RewriteLocalIP": ON_OFF[bool(params['rewrite_local_ip'])]
         }}
-
-        # Action messages
-        # Reset
-        reset_act_msg = {"ResetThisDomain": {}}
-
-        # Save
-        save_act_msg = {"SaveConfig": {}}
+        deployment_policy = params['deployment_policy']
+        deployment_policy_params = params['deployment_policy_params']
+        if deployment_policy is not None:
+            import_action_msg["Import"]["DeploymentPolicy"] = deployment_policy
+            if deployment_policy_params is not None:
+                import_action_msg["Import"]["DeploymentPolicyParams"] = deployment_policy_params
 
         #
         # Here the action begins
@@ -322,15 +373,10 @@ def main():
         tmp_result={"name": domain_name, "msg": None, "file": None, "changed": None, "failed": None}
 
         # List of configured domains
-        chk_code, chk_msg, chk_data = idg_mgmt.api_call(IDGApi.URI_DOMAIN_LIST, method='GET')
+        chk_code, chk_msg, configured_domains = idg_mgmt.get_domain_list(expected=domain_name)
 
         if chk_code == 200 and chk_msg == 'OK':  # If the answer is correct
 
-            if isinstance(chk_data['domain'], dict):  # if has only default domain
-                configured_domains = [chk_data['domain']['name']]
-            else:
-                configured_domains = [d['name'] for d in chk_data['domain']]
-
             if domain_name in configured_domains:  # Domain EXIST.
 
                 # pdb.set_trace()
@@ -341,21 +387,21 @@ def main():
 
                     # export and finish
                     # pdb.set_trace()
-                    exp_code, exp_msg, exp_data = idg_mgmt.api_call(IDGApi.URI_ACTION.format(domain_name), method='POST',
+                    exp_code, exp_msg, exp_data = idg_mgmt.api_call(action_uri, method='POST',
                                                                     data=json.dumps(export_action_msg))
 
                     if exp_code == 202 and exp_msg == 'Accepted':
-                        # Asynchronous actions export accepted. Wait for complete
-                        action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name), href=exp_data['_links']['location']['href'],
-                                                                     state=state)
-
-                        # Export completed. Get result
-                        doex_code, doex_msg, doex_data = idg_mgmt.api_call(exp_data['_links']['location']['href'], method='GET')
+                        # Asynchronous actions export accepted. Wait for complete and get the result
+                        doex_code, doex_msg, doex_data = idg_mgmt.wait_for_action_end(action_uri, href=exp_data['_links']['location']['href'], state=state)
 
                         if doex_code == 200 and doex_msg == 'OK':
+                            if doex_data['status'] == 'error':
+                                # The action ended with errors
+                                module.fail_json(msg=IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(doex_data['error'])))
+
                             # Export ok
                             tmp_result['file'] = doex_data['result']['file']
-                            tmp_result['msg'] = action_result
+                            tmp_result['msg'] = doex_data['status'].capitalize()
                             tmp_result['changed'] = True
                         else:
                             # Can't retrieve the export
@@ -376,19 +422,19 @@ def main():
                     IDGUtils.implement_check_mode(module, result)
 
                     # Reseted domain
-                    reset_code, reset_msg, reset_data = idg_mgmt.api_call(IDGApi.URI_ACTION.format(domain_name), method='POST',
-                                                                          data=json.dumps(reset_act_msg))
+                    reset_code, reset_msg, reset_data = idg_mgmt.api_call(action_uri, method='POST',
+                                                                          data=RESET_ACT_MSG)
 
                     # pdb.set_trace()
                     if reset_code == 202 and reset_msg == 'Accepted':
-                        # Asynchronous actions reset accepted. Wait for complete
-                        action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name), href=reset_data['_links']['location']['href'],
-                                                                     state=state)
-
-                        # Reseted completed
-                        dore_code, dore_msg, dore_data = idg_mgmt.api_call(reset_data['_links']['location']['href'], method='GET')
+                        # Asynchronous actions reset accepted. Wait for complete and get the result
+                        dore_code, dore_msg, dore_data = idg_mgmt.wait_for_action_end(action_uri, href=reset_data['_links']['location']['href'], state=state)
 
                         if dore_code == 200 and dore_msg == 'OK':
+                            if dore_data['status'] == 'error':
+                                # The action ended with errors
+                                module.fail_json(msg=IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(dore_data['error'])))
+
                             # Reseted successfully
                             tmp_result['msg'] = dore_data['status'].capitalize()
                             tmp_result['changed'] = True
@@ -412,10 +458,11 @@ def main():
                     # pdb.set_trace()
                     if qds_code == 200 and qds_msg == 'OK':
 
-                        if isinstance(qds_data['DomainStatus'], dict):
-                            domain_save_needed = qds_data['DomainStatus']['SaveNeeded']
-                        else:
-                            domain_save_needed = [d['SaveNeeded'] for d in qds_data['DomainStatus'] if d['Domain'] == domain_name][0]
+                        domain_save_needed = next((d['SaveNeeded'] for d in qds_data['DomainStatus'] if d['Domain'] == domain_name), None)
+
+                        if domain_save_needed is None:
+                            # The domain does not appear in the status
+                            module.fail_json(msg=IDGApi.ERROR_RETRIEVING_STATUS.format(state, domain_name))
 
                         # Saved domain
                         if domain_save_needed != 'off':
@@ -423,21 +470,22 @@ def main():
                             # If the user is working in only check mode we do not want to make any changes
                             IDGUtils.implement_check_mode(module, result)
 
-                            save_code, save_msg, save_data = idg_mgmt.api_call(IDGApi.URI_ACTION.format(domain_name), method='POST',
-                                                                               data=json.dumps(save_act_msg))
+                            save_code, save_msg, save_data = idg_mgmt.api_call(action_uri, method='POST',
+                                                                               data=SAVE_ACT_MSG)
 
                             # pdb.set_trace()
                             if save_code == 202 and save_msg == 'Accepted':
-                                # Asynchronous actions save accepted. Wait for complete
-                                action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name),
-                                                                             href=save_data['_links']['location']['href'], state=state)
-
-                                # Save ready
-                                dosv_code, dosv_msg, dosv_data = idg_mgmt.api_call(save_data['_links']['location']['href'], method='GET')
+                                # Asynchronous actions save accepted. Wait for complete and get the result
+                                dosv_code, dosv_msg, dosv_data = idg_mgmt.wait_for_action_end(action_uri,
+                                                                                              href=save_data['_links']['location']['href'], state=state)
 
                                 if dosv_code == 200 and dosv_msg == 'OK':
+                                    if dosv_data['status'] == 'error':
+                                        # The action ended with errors
+                                        module.fail_json(msg=IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(dosv_data['error'])))
+
                                     # Save completed
-                                    tmp_result['msg'] = action_result
+                                    tmp_result['msg'] = dosv_data['status'].capitalize()
                                     tmp_result['changed'] = True
                                 else:
                                     # Can't retrieve the save result
@@ -461,18 +509,18 @@ def main():
 
                     # Import
                     # pdb.set_trace()
-                    imp_code, imp_msg, imp_data = idg_mgmt.api_call(IDGApi.URI_ACTION.format(domain_name), method='POST',
+                    imp_code, imp_msg, imp_data = idg_mgmt.api_call(action_uri, method='POST',
                                                                     data=json.dumps(import_action_msg))
 
                     if imp_code == 202 and imp_msg == 'Accepted':
-                        # Asynchronous actions import accepted. Wait for complete
-                        action_result = idg_mgmt.wait_for_action_end(IDGApi.URI_ACTION.format(domain_name), href=imp_data['_links']['location']['href'],
-                                                                     state=state)
-
-                        # Import ready
-                        doim_code, doim_msg, doim_data = idg_mgmt.api_call(imp_data['_links']['location']['href'], method='GET')
+                        # Asynchronous actions import accepted. Wait for complete and get the result
+                        doim_code, doim_msg, doim_data = idg_mgmt.wait_for_action_end(action_uri, href=imp_data['_links']['location']['href'], state=state)
 
                         if doim_code == 200 and doim_msg == 'OK':
+                            if doim_data['status'] == 'error':
+                                # The action ended with errors
+                                module.fail_json(msg=IDGApi.GENERAL_ERROR.format(__MODULE_FULLNAME, state, domain_name) + str(ErrorHandler(doim_data['error'])))
+
                             # Export completed
                             import_results = doim_data['result']['Import']['import-results']
                             if import_results['detected-errors'] != 'false':
@@ -487,70 +535,11 @@ def main():
 
                                 tmp_result['results'].append({"export-details": import_results['export-details']})
 
-                                # EXEC-SCRIPT-RESULTS
-                                try:
-                                    exec_script_results = import_results['exec-script-results']
-                                    try:
-                                        if isinstance(exec_script_results['cfg-result'], list):
-
-                                            tmp_result['results'].append({"exec-script-results":
-                                                                     {"summary": {"total": len(exec_script_results['cfg-result']),
-                                                                                  "status": get_status_summary(exec_script_results['cfg-result'])},
-                                                                      "detail": exec_script_results['cfg-result']}})
-                                        else:
-                                            tmp_result['results'].append({"exec-script-results": exec_script_results['cfg-result']})
-
-                                    except Exception as e:
-                                        tmp_result['results'].append({"exec-script-results": exec_script_results})
-
-                                except Exception as e:
-                                    pass
-
-                                try:
-                                    tmp_result['results'].append({"file-copy-log": import_results['file-copy-log']['file-result']})
-                                except Exception as e:
-                                    pass
-
-                                try:
-                                    tmp_result['results'].append({"imported-debug": import_results['imported-debug']})
-                                except Exception as e:
-                                    pass
-
-                                # IMPORTED-FILES
-                                try:
-                                    imported_files = import_results['imported-files']
-                                    try:
-                                        if isinstance(imported_files['file'], list):
-
-                                            tmp_result['results'].append({"imported-files": {"summary": {"total": len(imported_files['file']),
-                                                                                                     "status": get_status_summary(imported_files['file'])},
-                                                                                         "detail": imported_files['file']}})
-                                        else:
-                                            tmp_result['results'].append({"imported-files": imported_files['file']})
-
-                                    except Exception as e:
-                                        tmp_result['results'].append({"imported-files": imported_files})
-
-                                except Exception as e:
-                                    pass
-
-                                # IMPORTED-OBJECTS
-                                try:
-                                    imported_objects = import_results['imported-objects']
-                                    try:
-                                        if isinstance(imported_objects['object'], list):
-
-                                            tmp_result['results'].append({"imported-objects": {"summary": {"total": len(imported_objects['object']),
-                                                                                           "status": get_status_summary(imported_objects['object'])},
-                                                                      "detail": imported_objects['object']}})
-                                        else:
-                                            tmp_result['results'].append({"imported-objects": imported_objects['object']})
-
-                                    except Exception as e:
-                                        tmp_result['results'].append({"imported-objects": imported_objects})
-
-                                except Exception as e:
-                                    pass
+                                # Sections with the detail of the import
+                                for section, item, summary in IMPORT_SECTIONS:
+                                    section_result = get_import_summary(import_results, section, item, summary)
+                                    if section_result is not None:
+                                        tmp_result['results'].append(section_result)
 
                                 tmp_result['msg'] = doim_data['status'].capitalize()
                                 tmp_result['changed'] = True
@@ -579,18 +568,15 @@ def main():
         # Finish
         #
         # Update
-        for k, v in tmp_result.items():
-            if v != None:
-                result[k] = v
+        result.update({k: v for k, v in tmp_result.items() if v is not None})
 
-    except (NameError, UnboundLocalError) as e:
-        # Very early error
-        module_except = AnsibleModule(argument_spec={})
-        module_except.fail_json(msg=to_native(e))
+    except IDGException as e:
+        # Controlled error while working with the appliance
+        module.fail_json(msg=to_native(e))
 
     except Exception as e:
         # Uncontrolled exception
-        module.fail_json(msg=(IDGUtils.UNCONTROLLED_EXCEPTION + '. {0}').format(to_native(e)))
+        module.fail_json(msg='{0}. {1}'.format(IDGUtils.UNCONTROLLED_EXCEPTION, to_native(e)))
     else:
         # That's all folks!
         module.exit_json(**result)
@@ -26,6 +26,21 @@ options:
     required: True
     suboptions:
 
+      cache_ttl:
+        description:
+          - Seconds that the list of domains of the device is kept in cache
+            under C(~/.ansible/tmp) between tasks. C(0) always reads it again.
+        default: 30
+        type: int
+
+      hedge_requests:
+        description:
+          - When the device is slow to answer the reading of the list of domains,
+            send the same request again and keep the first successful answer.
+          - Lowers the worst response times of a loaded device at the cost of some extra requests.
+        default: False
+        type: bool
+
       password:
         description:
           - The password for the user account used to connect to the
@@ -70,6 +85,10 @@ options:
         type: bool
 
 notes:
+  - When the python C(requests) library is installed, the calls of a task
+    reuse persistent (keep-alive) connections to the device.
+  - Some modules keep the list of domains of the device in a cache under
+    C(~/.ansible/tmp) for I(cache_ttl) seconds, to avoid reading it again in every task.
   - This documentation was developed mostly from the content
     provided by IBM in its web administration interface.
   - For more information consult the official documentation.